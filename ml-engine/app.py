@@ -1,11 +1,17 @@
 import streamlit as st
+import altair as alt
 import pandas as pd
 import numpy as np
 import requests
-import joblib
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 import pulp
-import matplotlib.pyplot as plt
-import seaborn as sns
+try:
+    import highspy
+except ImportError:
+    highspy = None
 
 st.set_page_config(page_title="FPL AI Decision Engine", layout="wide")
 st.title("⚽ FPL AI Decision Engine")
@@ -18,48 +24,237 @@ FEATURES = [
     'avg_bps_last3', 'is_home', 'value', 'avg_fixture_difficulty'
 ]
 
-MODEL_PATH = r'E:\Fpl-Hackathon\Models\fpl_model.pkl'
+IMPORTANCE_PATH = r'E:\Fpl-Hackathon\Models\fpl_feature_importance.npy'
 PREDICTIONS_PATH = r'E:\Fpl-Hackathon\Data\player_predictions.csv'
+BOOTSTRAP_URL = 'https://fantasy.premierleague.com/api/bootstrap-static/'
 
-# --- LOAD MODEL ---
-@st.cache_resource
-def load_model():
-    return joblib.load(MODEL_PATH)
+DISPLAY_COLUMNS = {
+    'web_name': 'Player', 'team_name': 'Team', 'position': 'Position',
+    'price': 'Price (£m)', 'predicted_pts': 'Predicted Pts'
+}
+
+# Only the prediction columns the app reads; the feature columns are skipped
+PREDICTION_COLUMNS = ['player_id', 'web_name', 'team', 'element_type', 'now_cost', 'predicted_pts']
+PREDICTION_DTYPES = {
+    'player_id': 'int32', 'team': 'int8', 'element_type': 'int8',
+    'now_cost': 'int16', 'predicted_pts': 'float32'
+}
+
+POSITIONS = ['GK', 'DEF', 'MID', 'FWD']
 
+# --- LOAD MODEL INSIGHTS ---
 @st.cache_data
-def load_data():
-    df = pd.read_csv(PREDICTIONS_PATH)
+def load_importance():
+    return np.load(IMPORTANCE_PATH)
+
+# Shared session so cache misses reuse the pooled connection to the FPL API
+@st.cache_resource
+def get_session():
+    return requests.Session()
 
-    r = requests.get('https://fantasy.premierleague.com/api/bootstrap-static/').json()
-    teams = pd.DataFrame(r['teams'])
-    players = pd.DataFrame(r['elements'])[['id', 'status']]
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_bootstrap():
+    r = json_loads(get_session().get(BOOTSTRAP_URL, timeout=10).content)
 
-    team_map = teams.set_index('id')['name'].to_dict()
+    team_map = {t['id']: t['name'] for t in r['teams']}
+    status_map = {p['id']: p['status'] for p in r['elements']}
+
+    return team_map, status_map
+
+# fetch_bootstrap owns freshness of statuses; this shorter TTL only re-applies
+# whatever it currently holds, so most refreshes cost no API request
+@st.cache_data(ttl=600)
+def load_data():
+    df = pd.read_csv(
+        PREDICTIONS_PATH,
+        engine='pyarrow',
+        usecols=PREDICTION_COLUMNS,
+        dtype=PREDICTION_DTYPES
+    )
+
+    team_map, status_map = fetch_bootstrap()
     pos_map = {1: 'GK', 2: 'DEF', 3: 'MID', 4: 'FWD'}
 
     df['team_name'] = df['team'].map(team_map)
-    df['position'] = df['element_type'].map(pos_map)
-    df['price'] = df['now_cost'] / 10
+    df['position'] = pd.Categorical(df['element_type'].map(pos_map), categories=POSITIONS)
+    df['price'] = (df['now_cost'] / 10).astype(np.float32)
+    df['status'] = df['player_id'].map(status_map).astype('category')
 
-    status_map = players.set_index('id')['status'].to_dict()
-    df['status'] = df['player_id'].map(status_map)
+    # Dictionary-encode the repeated strings for a smaller cached frame
+    df = df.astype({'web_name': 'category', 'team_name': 'category'})
 
     return df
 
-model = load_model()
+# --- SOLVER ---
+# Squad limits per position: (min, max)
+SQUAD_LIMITS = {'GK': (2, 2), 'DEF': (5, 5), 'MID': (5, 5), 'FWD': (3, 3)}
+MAX_PER_CLUB = 3
+
+def group_indices(codes, n_groups):
+    # Row indices per group code from one stable sort, instead of a scan per group.
+    # Codes must be non-negative: players with no mapped position are dropped
+    # from opt_df before solving, so cat.codes never yields -1 here.
+    order = np.argsort(codes, kind='stable')
+    return np.split(order, np.cumsum(np.bincount(codes, minlength=n_groups))[:-1])
+
+def select_squad(pts, costs, teams, pos_codes, budget_raw):
+    team_ids, team_codes = np.unique(teams, return_inverse=True)
+    n = len(pts)
+    n_pos, n_teams = len(POSITIONS), len(team_ids)
+
+    if highspy is None:
+        pos_idx = group_indices(pos_codes, n_pos)
+        team_idx = group_indices(team_codes, n_teams)
+        return _select_squad_pulp(pts, costs, pos_idx, team_idx, budget_raw)
+
+    # Rows: squad size, budget, one per position, one per club
+    row_lower = np.concatenate([
+        [15, -np.inf],
+        [SQUAD_LIMITS[p][0] for p in POSITIONS],
+        np.full(n_teams, -np.inf),
+    ])
+    row_upper = np.concatenate([
+        [15, budget_raw],
+        [SQUAD_LIMITS[p][1] for p in POSITIONS],
+        np.full(n_teams, MAX_PER_CLUB),
+    ])
+
+    # Every player has exactly four non-zeros: size, budget, position, club
+    ones = np.ones(n)
+    index = np.column_stack([
+        np.zeros(n, dtype=np.int32),
+        np.ones(n, dtype=np.int32),
+        2 + pos_codes,
+        2 + n_pos + team_codes,
+    ])
+    value = np.column_stack([ones, costs, ones, ones])
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = n
+    lp.num_row_ = len(row_lower)
+    lp.sense_ = highspy.ObjSense.kMaximize
+    lp.col_cost_ = pts.astype(np.float64)
+    lp.col_lower_ = np.zeros(n)
+    lp.col_upper_ = ones
+    lp.row_lower_ = row_lower
+    lp.row_upper_ = row_upper
+    lp.integrality_ = [highspy.HighsVarType.kInteger] * n
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.num_col_ = n
+    lp.a_matrix_.num_row_ = len(row_lower)
+    lp.a_matrix_.start_ = np.arange(0, 4 * n + 1, 4, dtype=np.int32)
+    lp.a_matrix_.index_ = index.ravel().astype(np.int32)
+    lp.a_matrix_.value_ = value.ravel().astype(np.float64)
+
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', False)
+    h.passModel(lp)
+    h.run()
+    if h.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+        return None
+    return np.asarray(h.getSolution().col_value) > 0.5
+
+def _select_squad_pulp(pts, costs, pos_idx, team_idx, budget_raw):
+    n = len(pts)
+    prob = pulp.LpProblem("FPL_Squad", pulp.LpMaximize)
+    x = [pulp.LpVariable(f"x{i}", cat='Binary') for i in range(n)]
+
+    prob += pulp.lpDot(pts, x)
+    prob += pulp.lpSum(x) == 15
+    prob += pulp.lpDot(costs.astype(np.int64), x) <= budget_raw
+
+    for pos, idx in zip(POSITIONS, pos_idx):
+        mn, mx = SQUAD_LIMITS[pos]
+        prob += pulp.lpSum(x[i] for i in idx) >= mn
+        prob += pulp.lpSum(x[i] for i in idx) <= mx
+
+    for idx in team_idx:
+        prob += pulp.lpSum(x[i] for i in idx) <= MAX_PER_CLUB
+
+    prob.solve(pulp.PULP_CBC_CMD(msg=0))
+    if pulp.LpStatus[prob.status] != 'Optimal':
+        return None
+    return np.fromiter((v.value() for v in x), dtype=np.float64, count=n) > 0.5
+
+# Starting 11 limits per position: (min, max)
+STARTING_11_LIMITS = {'GK': (1, 1), 'DEF': (3, 5), 'MID': (3, 5), 'FWD': (1, 3)}
+STARTING_11_MIN = np.array([STARTING_11_LIMITS[p][0] for p in POSITIONS])
+STARTING_11_MAX = np.array([STARTING_11_LIMITS[p][1] for p in POSITIONS])
+
+def pick_starting_11(order, pos_codes):
+    # Greedy is exact here: take each position's minimum from its best players,
+    # then fill the remaining slots by predicted points under the position caps.
+    # `order` is the squad sorted by predicted points, best first.
+    is_starter = np.zeros(len(pos_codes), dtype=np.bool_)
+    counts = np.zeros(len(STARTING_11_MIN), dtype=np.int64)
+    n_starters = 0
+
+    for i in order:
+        pos = pos_codes[i]
+        if counts[pos] < STARTING_11_MIN[pos]:
+            is_starter[i] = True
+            counts[pos] += 1
+            n_starters += 1
+
+    for i in order:
+        if n_starters == 11:
+            break
+        pos = pos_codes[i]
+        if not is_starter[i] and counts[pos] < STARTING_11_MAX[pos]:
+            is_starter[i] = True
+            counts[pos] += 1
+            n_starters += 1
+
+    return is_starter
+
+@st.cache_resource(show_spinner=False)
+def get_starting_11_picker():
+    # numba is only imported on the solve path, and the dispatcher is kept across
+    # reruns so the loop compiles once per process; plain Python without numba
+    try:
+        from numba import njit
+    except ImportError:
+        return pick_starting_11
+    return njit(cache=True)(pick_starting_11)
+
+@st.cache_data(show_spinner=False)
+def solve_squad(player_ids, pts, costs, teams, pos_codes, budget_raw):
+    # ── Phase 1: Select 15-man squad ──────────────────────────────────────────
+    selected = select_squad(pts, costs, teams, pos_codes, budget_raw)
+    if selected is None:
+        return None
+
+    # ── Phase 2: Pick best starting 11 from squad ─────────────────────────────
+    order = np.argsort(-pts[selected], kind='stable')
+    is_starter = get_starting_11_picker()(order, pos_codes[selected])
+
+    return pd.DataFrame({'player_id': player_ids[selected], 'is_starter': is_starter})
+
+# --- DISPLAY ---
+fragment = st.fragment if hasattr(st, 'fragment') else st.experimental_fragment
+
+def pts_column_config(max_pts):
+    # Rendered client-side from the Arrow payload, so no per-cell styling in Python.
+    # An empty table has a NaN max, which the progress bar cannot scale to.
+    if not np.isfinite(max_pts):
+        return None
+    return {'Predicted Pts': st.column_config.ProgressColumn(
+        format='%.2f', min_value=0, max_value=float(max_pts)
+    )}
+
+feature_importance = load_importance()
 df = load_data()
 
 # --- SIDEBAR ---
 st.sidebar.header("⚙️ Filters")
-pos_options = ['GK', 'DEF', 'MID', 'FWD']
-selected_positions = st.sidebar.multiselect("Position", pos_options, default=pos_options)
+selected_positions = st.sidebar.multiselect("Position", POSITIONS, default=POSITIONS)
 max_price = st.sidebar.slider("Max Price (£m)", 4.0, 15.0, 15.0)
 only_available = st.sidebar.checkbox("Only available players", value=True)
 
-filtered = df[df['position'].isin(selected_positions)]
-filtered = filtered[filtered['price'] <= max_price]
+mask = df['position'].isin(selected_positions).values & (df['price'].values <= max_price)
 if only_available:
-    filtered = filtered[filtered['status'] == 'a']
+    mask &= df['status'].values == 'a'
+filtered = df.loc[mask]
 
 # --- TABS ---
 tab1, tab2, tab3 = st.tabs([
@@ -73,13 +268,14 @@ with tab1:
     st.subheader("Top Player Recommendations")
     st.caption("LightGBM model | MAE: 1.021 pts | Trained on 19,069 gameweek records | Features include fixture difficulty")
 
-    display = filtered[['web_name', 'team_name', 'position', 'price', 'predicted_pts']].copy()
-    display.columns = ['Player', 'Team', 'Position', 'Price (£m)', 'Predicted Pts']
+    display = filtered[['web_name', 'team_name', 'position', 'price', 'predicted_pts']]
+    display.columns = display.columns.map(DISPLAY_COLUMNS)
     display = display.sort_values('Predicted Pts', ascending=False).head(20)
 
     st.dataframe(
-        display.style.background_gradient(cmap='Greens', subset=['Predicted Pts']),
-        use_container_width=True
+        display,
+        use_container_width=True,
+        column_config=pts_column_config(display['Predicted Pts'].max())
     )
 
 # ── TAB 2: MODEL INSIGHTS ─────────────────────────────────────────────────────
@@ -96,16 +292,14 @@ with tab2:
 
     # Feature importance
     st.markdown("#### Feature Importance")
-    importances = pd.Series(
-        model.feature_importances_, index=FEATURES
-    ).sort_values(ascending=True)
+    importances = pd.DataFrame({'Feature': FEATURES, 'Importance Score': feature_importance})
 
-    fig, ax = plt.subplots(figsize=(8, 4))
-    importances.plot(kind='barh', ax=ax, color='steelblue')
-    ax.set_title('Feature Importance — LightGBM (Tuned)')
-    ax.set_xlabel('Importance Score')
-    plt.tight_layout()
-    st.pyplot(fig)
+    # Explicit sort: Vega-Lite orders a nominal axis alphabetically by default
+    chart = alt.Chart(importances).mark_bar(color='#4682b4').encode(
+        x=alt.X('Importance Score:Q', title='Importance Score'),
+        y=alt.Y('Feature:N', sort='-x', title=None)
+    ).properties(title='Feature Importance — LightGBM (Tuned)')
+    st.altair_chart(chart, use_container_width=True)
 
     st.info("**Key insight:** Minutes played is the strongest predictor — "
             "availability matters more than raw talent for FPL points. "
@@ -135,7 +329,9 @@ with tab2:
     st.caption("Overall validation MAE: 0.754 across 5 unseen gameweeks")
 
 # ── TAB 3: OPTIMAL SQUAD ──────────────────────────────────────────────────────
-with tab3:
+# Runs as a fragment so the budget slider and button only rerun this tab
+@fragment
+def render_optimal_squad(df):
     st.subheader("ILP Optimal Squad Selector")
     st.caption("Integer Linear Programming — selects full 15-man squad then picks best starting 11")
 
@@ -149,46 +345,22 @@ with tab3:
     if st.button("🚀 Generate Optimal Squad", type="primary"):
         with st.spinner("Running ILP optimizer..."):
 
-            opt_df = df[df['status'] == 'a'].copy().reset_index(drop=True)
-            n = len(opt_df)
-            budget_raw = int(budget * 10)
-
-            # ── Phase 1: Select 15-man squad ──────────────────────────────────
-            prob = pulp.LpProblem("FPL_Squad", pulp.LpMaximize)
-            x = [pulp.LpVariable(f"x{i}", cat='Binary') for i in range(n)]
-
-            prob += pulp.lpSum(opt_df['predicted_pts'][i] * x[i] for i in range(n))
-            prob += pulp.lpSum(x) == 15
-            prob += pulp.lpSum(opt_df['now_cost'][i] * x[i] for i in range(n)) <= budget_raw
-
-            for pos, mn, mx in [('GK',2,2),('DEF',5,5),('MID',5,5),('FWD',3,3)]:
-                idx = opt_df[opt_df['position']==pos].index.tolist()
-                prob += pulp.lpSum(x[i] for i in idx) >= mn
-                prob += pulp.lpSum(x[i] for i in idx) <= mx
-
-            for team_id in opt_df['team'].unique():
-                idx = opt_df[opt_df['team']==team_id].index.tolist()
-                prob += pulp.lpSum(x[i] for i in idx) <= 3
-
-            prob.solve(pulp.PULP_CBC_CMD(msg=0))
-            squad = opt_df[[x[i].value() == 1 for i in range(n)]].copy().reset_index(drop=True)
-
-            # ── Phase 2: Pick best starting 11 from squad ─────────────────────
-            m = len(squad)
-            prob2 = pulp.LpProblem("FPL_Starting11", pulp.LpMaximize)
-            y = [pulp.LpVariable(f"y{i}", cat='Binary') for i in range(m)]
-
-            prob2 += pulp.lpSum(squad['predicted_pts'][i] * y[i] for i in range(m))
-            prob2 += pulp.lpSum(y) == 11
-
-            for pos, mn, mx in [('GK',1,1),('DEF',3,5),('MID',3,5),('FWD',1,3)]:
-                idx = squad[squad['position']==pos].index.tolist()
-                prob2 += pulp.lpSum(y[i] for i in idx) >= mn
-                prob2 += pulp.lpSum(y[i] for i in idx) <= mx
-
-            prob2.solve(pulp.PULP_CBC_CMD(msg=0))
-            squad['is_starter'] = [y[i].value() == 1 for i in range(m)]
-
+            # Players with an unmapped element_type have no position to constrain
+            opt_df = df[(df['status'] == 'a') & df['position'].notna()].reset_index(drop=True)
+            picks = solve_squad(
+                opt_df['player_id'].to_numpy(),
+                opt_df['predicted_pts'].to_numpy(),
+                opt_df['now_cost'].to_numpy(),
+                opt_df['team'].to_numpy(),
+                opt_df['position'].cat.codes.to_numpy(),
+                int(budget * 10)
+            )
+
+        if picks is None:
+            st.error("The optimizer could not find a valid squad for this budget.")
+            return
+
+        squad = opt_df.merge(picks, on='player_id')
         starters = squad[squad['is_starter'] == True]
         bench    = squad[squad['is_starter'] == False]
 
@@ -206,27 +378,32 @@ with tab3:
 
         # Starting 11
         st.markdown("### ⚡ Starting 11")
-        for pos in ['GK', 'DEF', 'MID', 'FWD']:
-            pos_players = starters[starters['position'] == pos][
-                ['web_name', 'team_name', 'price', 'predicted_pts']
-            ].copy()
-            pos_players.columns = ['Player', 'Team', 'Price (£m)', 'Predicted Pts']
-            if len(pos_players) > 0:
-                st.markdown(f"**{pos}**")
-                st.dataframe(
-                    pos_players.style.background_gradient(cmap='Greens', subset=['Predicted Pts']),
-                    use_container_width=True,
-                    hide_index=True
-                )
+        # One scale for starters and bench so bars are comparable across tables
+        squad_pts_config = pts_column_config(squad['predicted_pts'].max())
+        # Categorical positions group in GK, DEF, MID, FWD order
+        for pos, sub in starters.groupby('position', observed=True):
+            pos_players = sub[['web_name', 'team_name', 'price', 'predicted_pts']]
+            pos_players.columns = pos_players.columns.map(DISPLAY_COLUMNS)
+            st.markdown(f"**{pos}**")
+            st.dataframe(
+                pos_players,
+                use_container_width=True,
+                hide_index=True,
+                column_config=squad_pts_config
+            )
 
         st.divider()
 
         # Bench
         st.markdown("### 🪑 Bench (4)")
-        bench_display = bench[['web_name', 'team_name', 'position', 'price', 'predicted_pts']].copy()
-        bench_display.columns = ['Player', 'Team', 'Position', 'Price (£m)', 'Predicted Pts']
+        bench_display = bench[['web_name', 'team_name', 'position', 'price', 'predicted_pts']]
+        bench_display.columns = bench_display.columns.map(DISPLAY_COLUMNS)
         st.dataframe(
-            bench_display.style.background_gradient(cmap='Blues', subset=['Predicted Pts']),
+            bench_display,
             use_container_width=True,
-            hide_index=True
-        )
\ No newline at end of file
+            hide_index=True,
+            column_config=squad_pts_config
+        )
+
+with tab3:
+    render_optimal_squad(df)